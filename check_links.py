@@ -9,144 +9,382 @@ Pokud nalezne nefunkční odkazy, vypíše je, uloží do 'broken_links_report.m
 s kontextem (kde byl odkaz nalezen) a skončí s chybovým kódem 1.
 """
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import functools
+import aiohttp
+import lxml.html
+from lxml import etree
 from urllib.parse import urljoin, urlparse
-import concurrent.futures
 import time
-import threading
+import random
 import sys
 import collections
+import contextlib
+import json
+import os
+
+# uvloop je volitelný (na Windows není k dispozici), jinak se použije výchozí smyčka
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# aiodns umožní asynchronní DNS resolver, bez něj aiohttp překládá ve vláknech
+try:
+    import aiodns
+except ImportError:
+    aiodns = None
 
 # --- Hlavní nastavení ---
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
-MAX_WORKERS = 10
+MAX_WORKERS = 10                    # Max. souběžných požadavků na jeden host
+MAX_CONNECTIONS = MAX_WORKERS * 10  # Max. souběžných požadavků celkem
+# Horní mez náhodné pauzy (s) před každým požadavkem, aby se web nezahltil
+REQUEST_JITTER = 0.1
 LINK_TIMEOUT = 7
+PAGE_TIMEOUT = 10
+# Velikost bloku (B), po kterém se sitemapa stahuje a předává parseru
+SITEMAP_CHUNK_SIZE = 64 * 1024
+# Odkazy s těmito prefixy nevedou na interní HTTP stránky a nekontrolují se
+NON_HTTP_PREFIXES = ('mailto:', 'tel:', 'javascript:', '#')
+# Stavové kódy, kterými servery odmítají metodu HEAD -> zkusíme GET
+HEAD_FALLBACK_STATUSES = (403, 405, 501)
+# Opakování při výpadku spojení, timeoutu nebo chybě 5xx (exponenciální backoff)
+LINK_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# Jak dlouho (s) si pamatovat přeložené IP adresy (všechny odkazy míří na stejnou doménu)
+DNS_CACHE_TTL = 600
+# Jak dlouho (s) držet nečinná keep-alive spojení v poolu pro další požadavky
+KEEPALIVE_TIMEOUT = 60
+# Soubor s výsledky z minulých běhů a jak dlouho (s) jim věříme bez nové kontroly.
+# Workflow běží denně s mezerou Po->Čt: 36 h pokryje následující běh i se zpožděním
+# plánovače a každý odkaz se znovu ověří nejpozději každý druhý běh.
+LINK_CACHE_FILE = ".link_cache.json"
+LINK_CACHE_TTL = 36 * 60 * 60
+
+# Parametry požadavků vytvoříme jednou, ne znovu pro každý odkaz a stránku
+LINK_REQUEST_KWARGS = {
+    'headers': HEADERS,
+    'timeout': aiohttp.ClientTimeout(total=LINK_TIMEOUT),
+    'allow_redirects': True
+}
+PAGE_REQUEST_KWARGS = {
+    'headers': HEADERS,
+    'timeout': aiohttp.ClientTimeout(total=PAGE_TIMEOUT)
+}
 
 # --- Cache pro již zkontrolované odkazy ---
+# Čte a zapisuje se pouze z vlákna event loopu, zámek proto není potřeba
 link_cache = {}
-cache_lock = threading.Lock()
+# Právě probíhající kontroly (URL -> asyncio.Task), aby se stejný odkaz
+# nalezený na více stránkách současně nekontroloval vícekrát
+links_in_flight = {}
+# Čas skutečné kontroly odkazů převzatých z cache minulého běhu (URL -> timestamp)
+cached_link_checked_at = {}
 
 # Globální proměnná pro základní doménu webu
 BASE_DOMAIN = ""
 
-def get_sitemap_urls(sitemap_url):
-    """Načte URL sitemapy a vrátí seznam URL stránek."""
+# Semafor omezující celkový počet současně běžících požadavků (vytváří se v main)
+request_semaphore = None
+# Semafor omezující počet současně zpracovávaných stránek (vytváří se v main)
+page_semaphore = None
+# Semafory omezující počet souběžných požadavků na jednotlivé hosty
+host_semaphores = {}
+
+def read_sitemap_locs(parser, urls, child_sitemaps):
+    """
+    Zpracuje nové <loc> prvky z parseru sitemapy a hotové prvky uvolní z paměti.
+    URL z <sitemap> (sitemap index) přidá do child_sitemaps, ostatní do urls.
+    """
+    for _, loc in parser.read_events():
+        entry = loc.getparent()
+        text = (loc.text or "").strip()
+        # Prázdné <loc/> přeskočíme
+        if text:
+            if entry is not None and etree.QName(entry).localname == 'sitemap':
+                child_sitemaps.append(text)
+            else:
+                urls.append(text)
+        
+        loc.clear()
+        if entry is not None:
+            # Předchozí <url>/<sitemap> prvky jsou už kompletní, nepotřebujeme je
+            while entry.getprevious() is not None:
+                del entry.getparent()[0]
+
+@contextlib.asynccontextmanager
+async def throttle(url):
+    """
+    Počká na volné místo v globálním limitu i v limitu pro host dané URL
+    a přidá krátkou náhodnou pauzu, aby server nezačal požadavky omezovat.
+    """
+    try:
+        host = urlparse(url).hostname or ""
+    except ValueError:
+        host = ""
+    host_semaphore = host_semaphores.get(host)
+    if host_semaphore is None:
+        host_semaphore = host_semaphores[host] = asyncio.Semaphore(MAX_WORKERS)
+    
+    async with request_semaphore, host_semaphore:
+        await asyncio.sleep(random.uniform(0, REQUEST_JITTER))
+        yield
+
+def load_link_cache():
+    """
+    Převezme do link_cache funkční odkazy z minulých běhů, které jsou mladší
+    než LINK_CACHE_TTL; ty se v tomto běhu už nekontrolují. Chybějící nebo
+    poškozený soubor se ignoruje.
+    """
+    if not os.path.exists(LINK_CACHE_FILE):
+        return
+    now = time.time()
+    fresh_entries = {}
+    try:
+        with open(LINK_CACHE_FILE, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        for url, (status, message, checked_at) in entries.items():
+            if message == "OK" and now - checked_at < LINK_CACHE_TTL:
+                fresh_entries[url] = (status, message, checked_at)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"⚠️ Cache odkazů z minulého běhu nelze načíst: {e}", file=sys.stderr)
+        return
+    
+    for url, (status, message, checked_at) in fresh_entries.items():
+        link_cache[url] = (status, message)
+        cached_link_checked_at[url] = checked_at
+    print(f"ℹ️ Převzato {len(fresh_entries)} funkčních odkazů z cache minulého běhu.")
+
+def save_link_cache(run_started_at):
+    """
+    Uloží funkční odkazy pro příští spuštění. Odkazy převzaté z cache si
+    ponechají původní čas kontroly, aby po LINK_CACHE_TTL vypršely.
+    """
+    entries = {
+        url: (status, message, cached_link_checked_at.get(url, run_started_at))
+        for url, (status, message) in link_cache.items()
+        if message == "OK"
+    }
+    try:
+        with open(LINK_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+    except OSError as e:
+        print(f"⚠️ Cache odkazů nelze uložit: {e}", file=sys.stderr)
+
+async def get_sitemap_urls(session, sitemap_url, seen_sitemaps=None):
+    """
+    Načte URL sitemapy a vrátí seznam URL stránek.
+    XML se parsuje proudově; sitemap index se zpracuje rekurzivně.
+    Sada seen_sitemaps zabrání opakovanému načtení stejné sitemapy (a zacyklení).
+    """
+    if seen_sitemaps is None:
+        seen_sitemaps = {sitemap_url}
     urls = []
+    child_sitemaps = []
     print(f"ℹ️ Načítám sitemapu z: {sitemap_url}")
     try:
-        response = requests.get(sitemap_url, headers=HEADERS)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'lxml-xml')
-        for loc in soup.find_all('loc'):
-            urls.append(loc.text)
-        print(f"✅ Nalezeno {len(urls)} URL v sitemapě.")
-        return urls
-    except requests.exceptions.RequestException as e:
+        parser = etree.XMLPullParser(events=('end',), tag='{*}loc', recover=True)
+        async with session.get(sitemap_url, headers=HEADERS) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(SITEMAP_CHUNK_SIZE):
+                parser.feed(chunk)
+                read_sitemap_locs(parser, urls, child_sitemaps)
+        parser.close()
+        read_sitemap_locs(parser, urls, child_sitemaps)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        # ValueError: neplatná URL (např. prázdný label v hostname)
         print(f"❌ Chyba při načítání sitemapy: {e}", file=sys.stderr)
         return []
+    except etree.XMLSyntaxError as e:
+        print(f"❌ Chyba při parsování sitemapy: {e}", file=sys.stderr)
+        return []
+    
+    if child_sitemaps:
+        print(f"ℹ️ Sitemap index obsahuje {len(child_sitemaps)} dalších sitemap.")
+        new_sitemaps = []
+        for child_url in child_sitemaps:
+            if child_url in seen_sitemaps:
+                print(f"  -> ! Sitemapa {child_url} už byla načtena, přeskakuji.")
+                continue
+            seen_sitemaps.add(child_url)
+            new_sitemaps.append(child_url)
+        nested = await asyncio.gather(*[
+            get_sitemap_urls(session, u, seen_sitemaps) for u in new_sitemaps
+        ])
+        for nested_urls in nested:
+            urls.extend(nested_urls)
+    
+    print(f"✅ Nalezeno {len(urls)} URL v sitemapě.")
+    return urls
 
-def check_link(url):
+async def check_link(session, url):
     """
-    Zkontroluje stav jednoho odkazu pomocí metody GET (maskování).
+    Zkontroluje stav jednoho odkazu pomocí metody HEAD (maskování).
+    Pokud server HEAD nepodporuje, zkusí se GET bez čtení těla odpovědi.
+    Přechodné chyby (timeout, spojení, 5xx) se opakují s exponenciálním backoffem.
     """
     status_code = 0
     message = "OK"
     
-    if url.startswith(('mailto:', 'tel:', 'javascript:')) or url.startswith('#'):
+    if url.startswith(NON_HTTP_PREFIXES):
         return (url, 0, "SKIPPED")
         
-    try:
-        response = requests.get(
-            url, 
-            headers=HEADERS, 
-            timeout=LINK_TIMEOUT, 
-            allow_redirects=True,
-            stream=True 
-        )
-        status_code = response.status_code
-        if status_code >= 400:
-            message = "BROKEN"
-    except requests.exceptions.Timeout:
-        status_code = -1
-        message = "ERROR (Timeout)"
-    except requests.exceptions.ConnectionError:
-        status_code = -2
-        message = "ERROR (Connection)"
-    except requests.exceptions.RequestException:
-        status_code = -3
-        message = "ERROR (Jiná chyba)"
+    for attempt in range(LINK_RETRIES):
+        try:
+            async with throttle(url):
+                async with session.head(url, **LINK_REQUEST_KWARGS) as response:
+                    status_code = response.status
+                if status_code in HEAD_FALLBACK_STATUSES:
+                    # Tělo odpovědi nečteme, spojení rovnou uvolníme
+                    async with session.get(url, **LINK_REQUEST_KWARGS) as response:
+                        status_code = response.status
+                        response.release()
+            message = "BROKEN" if status_code >= 400 else "OK"
+            # Chyby 4xx jsou skutečně nefunkční odkazy, opakujeme jen 5xx
+            if status_code < 500:
+                break
+        except asyncio.TimeoutError:
+            status_code = -1
+            message = "ERROR (Timeout)"
+        except aiohttp.ClientConnectionError:
+            status_code = -2
+            message = "ERROR (Connection)"
+        except (aiohttp.ClientError, ValueError):
+            status_code = -3
+            message = "ERROR (Jiná chyba)"
+            break
+        
+        if attempt + 1 < LINK_RETRIES:
+            delay = RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random() * 0.5)
+            await asyncio.sleep(min(delay, RETRY_MAX_DELAY))
     
     return (url, status_code, message)
 
-def check_page_links(page_url):
+@functools.lru_cache(maxsize=4096)
+def parse_link(absolute_url):
     """
-    Najde všechny INTERNÍ odkazy na stránce a vrátí seznam nefunkčních.
+    Rozparsuje absolutní URL jen jednou a vrátí trojici
+    (URL bez fragmentu, schéma, hostname). Stejné odkazy se na webu
+    opakují napříč stránkami, proto je výsledek cachovaný.
     """
-    broken_links_on_page = []
-    
+    parsed = urlparse(absolute_url)
+    url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    if parsed.params:
+        url += f";{parsed.params}"
+    if parsed.query:
+        url += f"?{parsed.query}"
+    return url, parsed.scheme, parsed.hostname or ""
+
+def extract_page_links(page_url, content, charset=None):
+    """
+    Vrátí sadu INTERNÍCH odkazů (bez fragmentu) nalezených v HTML stránky.
+    Kódování z hlavičky Content-Type (charset) má přednost; bez něj ho lxml
+    odhadne z dokumentu (<meta charset>).
+    """
+    links_on_page = set()
+    parser = None
+    if charset:
+        try:
+            parser = lxml.html.HTMLParser(encoding=charset)
+        except LookupError:
+            # Neznámé kódování v hlavičce -> necháme lxml odhadnout
+            parser = None
     try:
-        response = requests.get(page_url, headers=HEADERS, timeout=10)
-        if response.status_code >= 400:
-            print(f"  -> 🚨 Chyba: Samotná stránka '{page_url}' je nefunkční (Status: {response.status_code})")
-            return [(page_url, response.status_code, "BROKEN (Page from sitemap)")]
-            
-        soup = BeautifulSoup(response.content, 'html.parser')
-        links_on_page = set()
+        # lxml parsuje v C, výrazně rychleji než BeautifulSoup s 'html.parser'.
+        # smart_strings=False: výsledné řetězce nedrží odkaz na celý DOM stránky.
+        hrefs = lxml.html.fromstring(content, parser=parser).xpath('//a/@href', smart_strings=False)
+    except etree.ParserError:
+        # Prázdný nebo neparsovatelný dokument -> žádné odkazy
+        return links_on_page
+    
+    for href in hrefs:
+        # Odkazy, které nikdy nebudou interní HTTP URL, zahodíme ještě před parsováním
+        if href.startswith(NON_HTTP_PREFIXES):
+            continue
+        try:
+            url, scheme, hostname = parse_link(urljoin(page_url, href))
+        except ValueError as e:
+            print(f"  -> ! Chyba při parsování URL: {href} ({e})")
+            continue
         
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href']
-            absolute_url = urljoin(page_url, href)
-            absolute_url = urlparse(absolute_url)._replace(fragment="").geturl()
-            links_on_page.add(absolute_url)
+        if scheme in ('http', 'https') and hostname == BASE_DOMAIN:
+            links_on_page.add(url)
+    return links_on_page
 
-        if not links_on_page:
-            return []
+async def check_page_links(session, page_url):
+    """
+    Najde všechny INTERNÍ odkazy na stránce a vrátí dvojici
+    (URL stránky, seznam nefunkčních odkazů).
+    """
+    # Rozpracovaných stránek je nejvýše MAX_WORKERS, aby kontroly odkazů
+    # nečekaly ve frontě semaforů za načítáním všech ostatních stránek
+    async with page_semaphore:
+        broken_links_on_page = []
+    
+        try:
+            async with throttle(page_url):
+                async with session.get(page_url, **PAGE_REQUEST_KWARGS) as response:
+                    status_code = response.status
+                    if status_code < 400:
+                        content = await response.read()
+                        charset = response.charset
+            if status_code >= 400:
+                print(f"  -> 🚨 Chyba: Samotná stránka '{page_url}' je nefunkční (Status: {status_code})")
+                return page_url, [(page_url, status_code, "BROKEN (Page from sitemap)")]
+            
+            links_on_page = extract_page_links(page_url, content, charset)
+            # HTML stránky už nepotřebujeme, při čekání na kontroly odkazů by zbytečně držel paměť
+            del content
+
+            if not links_on_page:
+                return page_url, []
 
-        links_for_executor = []
+            link_checks = {}
         
-        with cache_lock:
             for url in links_on_page:
-                try:
-                    parsed_link = urlparse(url)
-                    hostname = parsed_link.hostname or ""
-                    
-                    if parsed_link.scheme not in ('http', 'https') or hostname != BASE_DOMAIN:
-                        continue
-
-                    if url in link_cache:
-                        status, message = link_cache[url]
-                        if message not in ("OK", "SKIPPED"):
-                            broken_links_on_page.append((url, status, message))
-                    else:
-                        links_for_executor.append(url)
-                
-                except Exception as e:
-                    print(f"  -> ! Chyba při parsování URL: {url} ({e})")
+                if url in link_cache:
+                    status, message = link_cache[url]
+                    if message not in ("OK", "SKIPPED"):
+                        broken_links_on_page.append((url, status, message))
+                else:
+                    # Pokud odkaz už kontroluje jiná stránka, připojíme se k její kontrole
+                    task = links_in_flight.get(url)
+                    if task is None:
+                        task = asyncio.create_task(check_link(session, url))
+                        links_in_flight[url] = task
+                    link_checks[url] = task
         
-        if links_for_executor:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                futures = [executor.submit(check_link, url) for url in links_for_executor]
+            if link_checks:
+                # Výjimka jedné kontroly nesmí shodit celou stránku ani zůstat
+                # v links_in_flight, kde by ji dostaly i další stránky
+                results = await asyncio.gather(*link_checks.values(), return_exceptions=True)
+            
+                for url, result in zip(link_checks, results):
+                    links_in_flight.pop(url, None)
+                    if isinstance(result, BaseException):
+                        print(f"  -> ! Neočekávaná chyba při kontrole odkazu {url}: {result!r}", file=sys.stderr)
+                        status, message = -3, "ERROR (Jiná chyba)"
+                    else:
+                        _, status, message = result
+                    link_cache[url] = (status, message)
                 
-                for future in concurrent.futures.as_completed(futures):
-                    url, status, message = future.result()
-                    
-                    with cache_lock:
-                        link_cache[url] = (status, message)
-                        
                     if message not in ("OK", "SKIPPED"):
                         broken_links_on_page.append((url, status, message))
 
-    except requests.exceptions.RequestException as e:
-        print(f"  -> ❌ Chyba při načítání stránky {page_url}: {e}", file=sys.stderr)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            # ValueError: neplatná URL ze sitemapy (např. 'http://a..b/'), aiohttp ji
+            # nehlásí jako ClientError -> stránku jen zalogujeme a přeskočíme
+            print(f"  -> ❌ Chyba při načítání stránky {page_url}: {e}", file=sys.stderr)
     
-    return broken_links_on_page
+        return page_url, broken_links_on_page
 
-def main(sitemap_url):
+async def main(sitemap_url):
     """Hlavní funkce skriptu."""
-    global BASE_DOMAIN
+    global BASE_DOMAIN, request_semaphore, page_semaphore
     
     try:
         BASE_DOMAIN = urlparse(sitemap_url).hostname
@@ -159,7 +397,18 @@ def main(sitemap_url):
         sys.exit(1)
         
     start_time = time.time()
-    page_urls = get_sitemap_urls(sitemap_url)
+    load_link_cache()
+    request_semaphore = asyncio.Semaphore(MAX_CONNECTIONS)
+    page_semaphore = asyncio.Semaphore(MAX_WORKERS)
+    # Jeden pool spojení pro celý běh, TCP+TLS handshake se tak neopakuje pro každý odkaz
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        limit_per_host=MAX_WORKERS,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        resolver=aiohttp.AsyncResolver() if aiodns is not None else None,
+        keepalive_timeout=KEEPALIVE_TIMEOUT
+    )
     
     # *** ZMĚNA ZDE ***
     # Místo sady (set) použijeme slovník (dictionary),
@@ -167,11 +416,15 @@ def main(sitemap_url):
     # Použijeme defaultdict pro snadnější přidávání.
     all_broken_links_map = collections.defaultdict(set)
     
-    if page_urls:
-        for i, page_url in enumerate(page_urls):
-            print(f"\n🔎 Kontroluji stránku ({i+1}/{len(page_urls)}): {page_url}")
-            
-            broken_links = check_page_links(page_url)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        page_urls = await get_sitemap_urls(session, sitemap_url)
+        
+        # Stránky kontrolujeme souběžně (počet rozpracovaných omezuje page_semaphore)
+        # a výsledky zpracujeme hned, jak která stránka doběhne.
+        page_checks = [check_page_links(session, u) for u in page_urls]
+        for i, page_check in enumerate(asyncio.as_completed(page_checks)):
+            page_url, broken_links = await page_check
+            print(f"\n🔎 Zkontrolována stránka ({i+1}/{len(page_urls)}): {page_url}")
             
             if broken_links:
                 print(f"  🚨 Nalezeny nefunkční odkazy:")
@@ -182,7 +435,12 @@ def main(sitemap_url):
                     all_broken_links_map[url].add(page_url)
             else:
                 print("  ✅ Všechny interní odkazy se zdají být v pořádku.")
-                
+    
+    if page_urls:
+        # Ukládáme jen po skutečném běhu kontroly, jinak by např. výpadek
+        # sitemapy přepsal cache prázdným souborem
+        save_link_cache(start_time)
+        
         end_time = time.time()
         print("\n" + "="*40)
         print("--- 🏁 KONTROLA DOKONČENA (SOUHRN) ---")
@@ -212,9 +470,10 @@ def main(sitemap_url):
                         f.write("**Nalezeno na těchto stránkách:**\n")
                         print("   Nalezeno na:")
                         
-                        for page in sorted(list(pages)):
-                            print(f"   - {page}")
-                            f.write(f"- {page}\n")
+                        # Stránky seřadíme jen jednou a zapíšeme je najednou
+                        sorted_pages = sorted(pages)
+                        print("\n".join(f"   - {page}" for page in sorted_pages))
+                        f.writelines(f"- {page}\n" for page in sorted_pages)
                         f.write("\n") # Přidá mezeru před dalším odkazem
                             
                 print("\nℹ️ Report o chybách byl uložen do souboru broken_links_report.md")
@@ -238,4 +497,7 @@ if __name__ == "__main__":
         print("Příklad: python check_links.py https://web.cz/sitemap.xml", file=sys.stderr)
         sys.exit(1)
     
-    main(sitemap_url=sys.argv[1])
+    if uvloop is not None:
+        uvloop.run(main(sitemap_url=sys.argv[1]))
+    else:
+        asyncio.run(main(sitemap_url=sys.argv[1]))